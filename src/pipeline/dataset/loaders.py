@@ -3,6 +3,7 @@ This module defines an HDF5 Dataset class compatible with the
 simulation data.
 """
 
+import os
 from typing import Tuple
 
 import numpy as np
@@ -34,7 +35,9 @@ class H5Dataset(Dataset):
         The data type for the tensors, typically set to torch.float32
         for efficiency.
     h5f : h5py.File
-        A handle for the opened HDF5 file.
+        A handle for the opened HDF5 file (None in a pickled copy until first read).
+    pid : int
+        Id of the process that opened `h5f`.
     group_names : list of str
         List of names for each group (simulation run) in the HDF5 file.
     group_boundaries : np.ndarray
@@ -78,6 +81,7 @@ class H5Dataset(Dataset):
 
         # Open the HDF5 file corresponding to the chosen mode
         self.h5f = h5py.File(f'{self.path}/{self.mode}_data.h5', 'r')
+        self.pid = os.getpid()
 
         # Retrieve the names of the groups (simulation runs) in the HDF5 file
         self.group_names = list(self.h5f.keys())
@@ -133,6 +137,8 @@ class H5Dataset(Dataset):
         IndexError
             If the index is out of range for the dataset.
         """
+        self._ensure_open()
+
         # Identify the group (simulation run) and the index within that group
         group_id = np.digitize(index, self.group_boundaries, right=False) - 1
         index_within_group = index - self.group_boundaries[group_id]
@@ -148,6 +154,34 @@ class H5Dataset(Dataset):
         # adding channel dimension (C=1, H, W)
         return field_data[None, :, :], next_field_data[None, :, :]
 
+    def _ensure_open(self):
+        """
+        Open the HDF5 file in the current process, if not already done.
+
+        An HDF5 handle inherited from a parent process (e.g., by a forked DataLoader
+        worker) is not safe to read from, and a pickled copy (e.g., in a spawned
+        worker) has none, so each process opens its own.
+        """
+        if self.h5f is None or self.pid != os.getpid():
+            self.h5f = h5py.File(f'{self.path}/{self.mode}_data.h5', 'r')
+            self.pid = os.getpid()
+
+    def __getstate__(self) -> dict:
+        """
+        Return the state for pickling, without the HDF5 handle,
+        which cannot be pickled. It is reopened on first read.
+        """
+        state = self.__dict__.copy()
+        state['h5f'] = None
+        state['pid'] = None
+        return state
+
+    def __setstate__(self, state: dict):
+        """
+        Restore the state of a pickled dataset.
+        """
+        self.__dict__.update(state)
+
     def close(self):
         """
         Close the HDF5 file to free up resources.
@@ -156,7 +190,8 @@ class H5Dataset(Dataset):
         to ensure that the HDF5 file is properly closed, releasing any
         held resources.
         """
-        self.h5f.close()
+        if self.h5f is not None:
+            self.h5f.close()
 
     def get_meshgrid(
         self, group_id: int = 0,
@@ -176,6 +211,7 @@ class H5Dataset(Dataset):
         For simplicity, we assume that the coordinate grids are identical
         across runs / groups
         """
+        self._ensure_open()
         x_grid = torch.from_numpy(
             self.h5f[self.group_names[group_id]]['x_coordinates'][:],
         ).to(self.dtype)
@@ -204,6 +240,7 @@ class H5Dataset(Dataset):
             - field: corresponding tensor of field values.
 
         """
+        self._ensure_open()
         times = torch.from_numpy(
             self.h5f[self.group_names[group_id]]['time'][:],
         ).to(self.dtype)
@@ -14,10 +14,10 @@ Marvin Pförtner, Lukas Tatzel, and Søren Hauberg.
 arXiv preprint arXiv:2406.03334 (2024).
 
 """
-import copy
-import os
+import functools
 import glob
-import pickle
+import hashlib
+import os
 import random
 from typing import Tuple, Callable, Dict, List
 
@@ -42,8 +42,8 @@ def randn_params(
     params_template : dict
         model parameters, used as a template for the samples
 
-    precision : torch.tensor
-        single input, typically of dimension (C, H, W)
+    precision : torch.tensor | float
+        scalar precision of the normal distribution
 
     n_samples : int
         number of samples requested
@@ -54,17 +54,16 @@ def randn_params(
         list of sampled model parameters
 
     """
-    samples = []
+    scale = torch.as_tensor(precision).rsqrt()
 
-    f = 1/torch.sqrt(precision)
-    for _ in range(n_samples):
-        samples.append(
-            {
-                k: f*torch.randn_like(v, device=v.device)
-                for k, v in param_template.items()
-            }
-        )
-    return samples
+    # draw all samples for each parameter tensor at once
+    samples = {
+        k: torch.empty(
+            (n_samples,) + v.shape, dtype=v.dtype, device=v.device,
+        ).normal_().mul_(scale)
+        for k, v in param_template.items()
+    }
+    return [{k: v[i] for k, v in samples.items()} for i in range(n_samples)]
 
 
 def linearized_predict(
@@ -107,7 +106,115 @@ def linearized_predict(
     return outputs+jvp_val
 
 
-def batched_jjt(func: Callable, params: Dict, xb: torch.Tensor, yb: torch.Tensor):
+def linearized_predict_batched(
+    func: Callable,
+    param0: Dict,
+    param1: Dict,
+    x: torch.Tensor,
+) -> torch.Tensor:
+    """
+    Evaluates the linearized model (see `linearized_predict`) for a batch of
+    S parameter samples at once. The jvp is vectorized across the samples,
+    so that the primal output f(x; param0) is only computed once.
+
+    Parameters:
+    -----------
+
+    func : callable
+        single evaluation function
+
+    params0 : dict
+        nominal model parameters
+
+    params1 : dict
+        model parameters to-be-evaluated, each with a leading sample dimension S
+
+    x : torch.tensor
+        single input, typically of dimension (C, H, W)
+
+    Returns:
+    --------
+    torch.tensor
+        model outputs, typically of dimension (S, C, H, W)
+
+    """
+    def fp(params):
+        return func(params, x)
+
+    def jvp_fn(param_diff):
+        return tf.jvp(fp, (param0,), (param_diff,))
+
+    param_diff = {k: param1[k]-v for k, v in param0.items()}
+    outputs, jvp_val = tf.vmap(jvp_fn, out_dims=(None, 0))(param_diff)
+    return outputs+jvp_val
+
+
+def make_flat_param_spec(params: Dict) -> Tuple[Dict, int]:
+    """
+    Computes where each parameter tensor lives in the flattened parameter vector,
+    in the (fixed) iteration order of `params`.
+
+    Parameters:
+    -----------
+
+    params : dict
+        model parameters
+
+    Returns:
+    --------
+    dict
+        slice of the flattened parameter vector occupied by each parameter
+
+    int
+        total number of parameters P
+    """
+    spec = {}
+    offset = 0
+    for k, v in params.items():
+        spec[k] = slice(offset, offset + v.numel())
+        offset += v.numel()
+    return spec, offset
+
+
+def select_jac_mode(func: Callable, params: Dict, x: torch.Tensor, y: torch.Tensor) -> str:
+    """
+    Chooses how the per-sample Jacobian of func should be computed, based on its output
+    dimension O, which is probed with a single evaluation, and the number of parameters P.
+
+    Parameters:
+    -----------
+
+    func : callable
+        single evaluation function -- typically, a loss function (in which O = 1)
+
+    params : dict
+        loss / model parameters
+
+    x : torch.tensor
+        single input -- typically of dimension (C, H, W)
+
+    y : torch.tensor
+        corresponding target -- typically of dimension (C, H, W)
+
+    Returns:
+    --------
+    str
+        'rev' (one vjp per output) if O <= P, else 'fwd' (one jvp per parameter)
+    """
+    n_out = func(params, x, y).numel()
+    n_params = sum(v.numel() for v in params.values())
+    return 'rev' if n_out <= n_params else 'fwd'
+
+
+def batched_jjt(
+    func: Callable,
+    params: Dict,
+    xb: torch.Tensor,
+    yb: torch.Tensor,
+    mode: str = 'auto',
+    jac_buffer: torch.Tensor = None,
+    param_spec: Dict = None,
+) -> torch.Tensor:
     """
     Given func: R^d --> R^O and a batch of B data points, computes BO-by-BO the matrix JJt,
     where J is the jacobian of func (with respect to params) evaluated at points in (xb, yb). 
@@ -130,37 +237,311 @@ def batched_jjt(func: Callable, params: Dict, xb: torch.Tensor, yb: torch.Tensor
     yb : torch.tensor 
         batch of corresponding targets -- typically of dimension (B, C, H, W)
 
+    mode : str
+        'rev' computes J with reverse-mode (one vjp per output), 'fwd' with forward-mode
+        (one jvp per parameter). 'auto' picks whichever needs fewer passes (see
+        `select_jac_mode`), at the cost of an extra evaluation of func on every call.
+
+    jac_buffer : torch.tensor
+        preallocated buffer of dimension (M, P), with M >= BO. If given, J is assembled
+        into its first BO rows and contracted with a single matmul, so the same
+        allocation can be reused across batches. Otherwise, JJt is accumulated
+        block by block and the full Jacobian is never materialized.
+
+    param_spec : dict
+        slices of the flattened parameters, as returned by `make_flat_param_spec`
+        -- only used with `jac_buffer`, and computed from params if not given
+
     Returns:
     --------
     torch.tensor
         JJ.T -- of dimension BO-by-BO
     """
+    if mode == 'auto':
+        mode = select_jac_mode(func, params, xb[0], yb[0])
+    if mode == 'rev':
+        jac_fn = tf.jacrev(func)
+    elif mode == 'fwd':
+        jac_fn = tf.jacfwd(func)
+    else:
+        raise ValueError(f"mode must be one of 'auto', 'rev' or 'fwd', got {mode!r}")
+
     # Compute J(xb,yb)
-    jac = tf.vmap(tf.jacrev(func), (None, 0, 0))(params, xb, yb)
+    jac = tf.vmap(jac_fn, (None, 0, 0))(params, xb, yb)
     # jac is a dict of torch tensors (keys correspond to params)
-    # the 0-th dimension of each tensor is the batch dimension (vmapped dim).
-    jac = jac.values()
-
-    # flattens the tensor in each batch dimension
-    jac = [j.flatten(1) for j in jac]
+    # the 0-th dimension of each tensor is the batch dimension (vmapped dim),
+    # followed by the output dimensions and then the parameter dimensions.
+    k0 = next(iter(jac))
+    n = jac[k0].numel() // params[k0].numel()
+
+    if jac_buffer is not None:
+        # copy each block into its columns of the flat (N, P) Jacobian
+        if param_spec is None:
+            param_spec, _ = make_flat_param_spec(params)
+        jac_flat = jac_buffer[:n]
+        for k in list(jac):
+            jac_flat[:, param_spec[k]].copy_(jac.pop(k).reshape(n, -1))
+        return jac_flat @ jac_flat.mT
 
     # Compute J@J.T where J is (N,P) and J.T is (P, M=N) 
-    # contraction across parameter dimension of the Jacobian
-    einsum_expr = 'NP,MP->NM'
-
-    # for each block of parameter derivatives in the jacobian, contract across the parameter dimension
-    result = torch.stack([torch.einsum(einsum_expr, j, j) for j in jac]) 
-    # sum across all parameter blocks to complete the contraction
-    result = result.sum(0)
+    # contraction across parameter dimension of the Jacobian, accumulated in place
+    # over the parameter blocks. Each block is released as soon as it is consumed,
+    # so no copy of the full Jacobian is ever made.
+    result = torch.zeros(n, n, dtype=params[k0].dtype, device=xb.device)
+    for k in list(jac):
+        # flattens the batch and output dimensions, and the parameter dimensions
+        j = jac.pop(k).reshape(n, -1)
+        result.addmm_(j, j.mT)
     return result
 
 
+def batched_jjt_matfree(
+    func: Callable,
+    params: Dict,
+    xb: torch.Tensor,
+    yb: torch.Tensor,
+    chunk_size: int = 1,
+) -> torch.Tensor:
+    """
+    Matrix-free variant of `batched_jjt`, computing the BO-by-BO matrix JJt
+    without ever materializing the full BO-by-P Jacobian J.
+
+    Each column of JJt is obtained as J(J.T e_i), where e_i is the i-th standard
+    basis vector of the output space -- i.e., one vjp followed by one jvp. Only
+    `chunk_size` rows of J are held in memory at any time.
+
+    Parameters:
+    -----------
+
+    func : callable
+        single evaluation function -- typically, a loss function (in which O = 1)
+
+    params : dict
+        loss / model parameters
+
+    xb : torch.tensor
+        batch of inputs -- typically of dimension (B, C, H, W)
+
+    yb : torch.tensor
+        batch of corresponding targets -- typically of dimension (B, C, H, W)
+
+    chunk_size : int
+        number of columns of JJt computed simultaneously -- trades memory for speed
+
+    Returns:
+    --------
+    torch.tensor
+        JJ.T -- of dimension BO-by-BO
+    """
+    def fp(p):
+        return tf.vmap(func, (None, 0, 0))(p, xb, yb).reshape(-1)
+
+    out, vjp_fn = tf.vjp(fp, params)
+    basis = torch.eye(out.numel(), dtype=out.dtype, device=out.device)
+
+    def jjt_column(e):
+        # J.T e is a single row of J
+        j_row = vjp_fn(e)[0]
+        # J (J.T e) is a single column of JJt
+        return tf.jvp(fp, (params,), (j_row,))[1]
+
+    return tf.vmap(jjt_column, chunk_size=chunk_size)(basis)
+
+
+def psd_inv(
+    mats: torch.Tensor,
+    jitter: float = 1e-6,
+    rtol: float = 1e-3,
+) -> torch.Tensor:
+    """
+    Inverts a batch of symmetric positive semi-definite matrices, such as JJt.
+
+    A Cholesky factorization of each regularized matrix M + d I is attempted first,
+    which is considerably cheaper than the SVD used by the general pseudoinverse.
+    Its inverse differs from inv(M) by a relative error of about d / lambda_min(M).
+    The Frobenius norm of the inverse gives a lower bound on lambda_min(M + d I),
+    and matrices for which this bound cannot guarantee an error below `rtol`
+    (in particular, numerically rank deficient matrices) fall back to a
+    pseudoinverse computed from the eigendecomposition.
+
+    Parameters:
+    -----------
+
+    mats : torch.tensor
+        batch of symmetric positive semi-definite matrices -- of dimension (N, M, M)
+
+    jitter : float
+        diagonal regularization d, relative to the mean diagonal entry of each matrix
+
+    rtol : float
+        largest accepted relative error d / lambda_min(M) of the Cholesky inverse
+
+    Returns:
+    --------
+    torch.tensor
+        batch of (pseudo)inverse matrices -- of dimension (N, M, M)
+    """
+    n = mats.shape[-1]
+    tol = n * torch.finfo(mats.dtype).eps
+    eye = torch.eye(n, dtype=mats.dtype, device=mats.device)
+    delta = jitter * mats.diagonal(dim1=-2, dim2=-1).mean(-1)
+
+    chol, info = torch.linalg.cholesky_ex(mats + delta[..., None, None] * eye)
+    inv = torch.cholesky_inverse(chol)
+
+    # ||inv||_F >= ||inv||_2 = 1 / lambda_min(M + d I), hence
+    # lambda_min(M) >= 1 / ||inv||_F - d
+    lambda_lower = 1 / torch.linalg.matrix_norm(inv) - delta
+    failed = (info != 0) | ~(delta <= rtol * lambda_lower)
+
+    if failed.any():
+        w, v = torch.linalg.eigh(mats[failed])
+        w_inv = torch.where(
+            w > tol * w.amax(-1, keepdim=True), 1/w, torch.zeros_like(w),
+        )
+        inv[failed] = v @ (w_inv[..., None] * v.mT)
+    return inv
+
+
+def batched_pinv(mats: List) -> List:
+    """
+    Computes the pseudoinverse of each matrix in a list of JJt matrices.
+
+    Matrices of identical shape are stacked and inverted with a single batched
+    call, which replaces many small serial decompositions. Typically, all
+    batches share the same shape except for a trailing partial batch, which
+    is handled as its own group.
+
+    Parameters:
+    -----------
+
+    mats : list
+        list of symmetric positive semi-definite matrices, e.g., Jb@Jb.T for each batch b
+
+    Returns:
+    --------
+    list
+        list containing the pseudoinverse of each matrix (on the cpu),
+        in the same order as `mats`
+    """
+    # group matrices by shape, preserving their original positions
+    groups = {}
+    for b, m in enumerate(mats):
+        groups.setdefault(m.shape, []).append(b)
+
+    inv_mats = [None] * len(mats)
+    for idx in groups.values():
+        inv = psd_inv(torch.stack([mats[b] for b in idx]))
+        for b, inv_b in zip(idx, inv.cpu().unbind(0)):
+            inv_mats[b] = inv_b
+    return inv_mats
+
+
+def inv_jjt_cache_key(
+    func: Callable,
+    base_params: Dict,
+    train_loader: DataLoader,
+) -> str:
+    """
+    Computes a digest identifying the precomputed inverses for a given function,
+    set of parameters, and DataLoader.
+
+    Parameters:
+    -----------
+
+    func : callable
+        single evaluation function -- typically, a loss function
+
+    base_params : dict
+        nominal model parameters
+
+    train_loader : torch.utils.data.dataloader
+        DataLoader containing the training data
+
+    Returns:
+    --------
+    str
+        hexadecimal sha256 digest
+    """
+    digest = hashlib.sha256()
+    for k, v in base_params.items():
+        digest.update(k.encode())
+        # hash the raw bytes, as numpy has no equivalent of e.g. bfloat16
+        digest.update(v.detach().cpu().reshape(-1).view(torch.uint8).numpy().tobytes())
+    digest.update(
+        repr((
+            len(train_loader.dataset),
+            train_loader.batch_size,
+            train_loader.drop_last,
+            type(train_loader.sampler).__name__,
+            getattr(func, '__qualname__', type(func).__qualname__),
+        )).encode()
+    )
+    return digest.hexdigest()
+
+
+def prefetching_loader(
+    loader: DataLoader,
+    num_workers: int = None,
+    pin_memory: bool = False,
+    prefetch_factor: int = 4,
+) -> DataLoader:
+    """
+    Returns a DataLoader over the same batches as `loader` (same dataset, batch size,
+    sampler and order), which loads them in persistent worker processes, so that reading
+    the data overlaps with the computations on the device.
+
+    Loaders that already use worker processes are returned unchanged,
+    as are loaders built from a custom batch sampler.
+
+    Parameters:
+    -----------
+
+    loader : torch.utils.data.dataloader
+        DataLoader to be wrapped -- must not shuffle, as the batches are indexed by position
+
+    num_workers : int
+        number of worker processes, defaults to half the number of cpus
+
+    pin_memory : bool
+        if True, batches are loaded into page-locked memory -- only useful when they
+        are subsequently copied to a gpu
+
+    prefetch_factor : int
+        number of batches loaded in advance by each worker
+
+    Returns:
+    --------
+    torch.utils.data.dataloader
+        DataLoader yielding the same batches as `loader`
+    """
+    if loader.num_workers > 0 or loader.batch_size is None:
+        return loader
+    if num_workers is None:
+        num_workers = max(1, (os.cpu_count() or 2) // 2)
+    return DataLoader(
+        loader.dataset,
+        batch_size=loader.batch_size,
+        sampler=loader.sampler,
+        drop_last=loader.drop_last,
+        collate_fn=loader.collate_fn,
+        num_workers=num_workers,
+        pin_memory=pin_memory,
+        persistent_workers=True,
+        prefetch_factor=prefetch_factor,
+    )
+
+
 def precompute_inv_jjt(
     func: Callable,
     base_params: Dict,
     train_loader: DataLoader,
+    cache_dir: str = None,
+    matrix_free: bool = False,
+    compiled: bool = False,
+    reuse_jac_buffer: bool = False,
     save_path: str = None,
-) -> List:
+) -> torch.Tensor | List:
     """
     Precomputes the core inverse matrices for all batches in the DataLoader.
 
@@ -178,32 +559,118 @@ def precompute_inv_jjt(
         nominal model parameters
 
     train_loader : torch.utils.data.dataloader
-        DataLoader containing the training data
+        DataLoader containing the training data -- must iterate over the batches
+        in a fixed order (i.e., no shuffling), as the inverses are indexed by batch
+
+    cache_dir : str
+        directory in which the inverses are cached, keyed by `inv_jjt_cache_key`.
+        If None, the inverses are always recomputed and not saved.
+
+    matrix_free : bool
+        if True, computes each Jb@Jb.T without materializing Jb (see `batched_jjt_matfree`),
+        which substantially reduces the memory footprint for large models
+
+    compiled : bool
+        if True, uses the compiled variant of `batched_jjt` (ignored when `matrix_free` is True)
+
+    reuse_jac_buffer : bool
+        if True, each Jb is assembled into one preallocated (BO, P) buffer shared by all
+        batches (see `batched_jjt`). This avoids reallocating the flat Jacobian per batch,
+        but the buffer is held in addition to the Jacobian blocks, raising peak memory.
+        Ignored when `matrix_free` is True.
+
+    save_path : str
+        no longer supported, raises a TypeError -- use `cache_dir`
 
     Returns:
     --------
-    list
-        list containing inv(Jb@Jb.T) for each batch b.
+    torch.tensor | list
+        inv(Jb@Jb.T) for each batch b, indexed by b. If all batches have the same size,
+        this is a single tensor of dimension (N_batches, BO, BO), else a list of tensors.
     """
+    if save_path is not None:
+        raise TypeError(
+            'save_path was replaced by cache_dir, a directory in which caches are keyed by '
+            'inv_jjt_cache_key. Caches pickled to save_path are no longer read.'
+        )
+
+    device = next(iter(base_params.items()))[1].device
+    cache_path = None
+    if cache_dir is not None:
+        key = inv_jjt_cache_key(func, base_params, train_loader)
+        cache_path = os.path.join(cache_dir, f'{key}.pt')
+
     # if the cache already exists, load it, else create it.
-    if os.path.exists(save_path):
-        with open(save_path, 'rb') as f:
-            inv_jjt_cache = pickle.load(f)
+    if cache_path is not None and os.path.exists(cache_path):
+        inv_jjt_cache = torch.load(cache_path, map_location='cpu', weights_only=True)
     else:
-        inv_jjt_cache = []
-        device = next(iter(base_params.items()))[1].device
+        jjts = []
+        # batched_jjt pops blocks from the jacobian dict and may write into a buffer,
+        # so graph breaks are tolerated rather than enforced with fullgraph
+        jjt_fn = compiled_variant(batched_jjt) if compiled else batched_jjt
+        jac_buffer = None
+        param_spec = None
+        mode = None
 
         for _, data in enumerate(tqdm.tqdm(train_loader, desc='Precomputations')):
             xb, yb = data
-            xb = xb.to(device)
-            yb = yb.to(device)
-            inv_jjt_cache.append(
-                torch.linalg.pinv(batched_jjt(func, base_params, xb, yb)).cpu()
+            xb = xb.to(device, non_blocking=True)
+            yb = yb.to(device, non_blocking=True)
+            if matrix_free:
+                jjts.append(batched_jjt_matfree(func, base_params, xb, yb))
+                continue
+            if mode is None:
+                # the jacobian mode is chosen once, rather than probed on every batch
+                mode = select_jac_mode(func, base_params, xb[0], yb[0])
+            if reuse_jac_buffer and jac_buffer is None:
+                # the first batch is the largest, so its Jacobian fits every batch
+                n_out = func(base_params, xb[0], yb[0]).numel()
+                param_spec, n_params = make_flat_param_spec(base_params)
+                jac_buffer = torch.empty(
+                    len(xb) * n_out,
+                    n_params,
+                    dtype=next(iter(base_params.values())).dtype,
+                    device=device,
+                )
+            jjts.append(
+                jjt_fn(
+                    func,
+                    base_params,
+                    xb,
+                    yb,
+                    mode,
+                    jac_buffer=jac_buffer,
+                    param_spec=param_spec,
+                )
             )
-        
+        del jac_buffer
+
+        # invert all batches at once, rather than one pinv call per batch
+        if not jjts:
+            inv_jjt_cache = []
+        elif all(jjt.shape == jjts[0].shape for jjt in jjts):
+            # uniform batches are kept as one contiguous tensor
+            inv_jjt_cache = psd_inv(torch.stack(jjts)).cpu()
+        else:
+            inv_jjt_cache = batched_pinv(jjts)
+        del jjts
+
+        # return the blocks freed by the Jacobian computations to the device
+        # once, before sampling, rather than inside the per-batch loop
+        if device.type == 'cuda':
+            torch.cuda.empty_cache()
+
         # save
-        with open(save_path, 'wb') as f:
-            pickle.dump(inv_jjt_cache, f)
+        if cache_path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            torch.save(inv_jjt_cache, cache_path)
+
+    # page-locked host memory enables asynchronous copies to the gpu
+    if device.type == 'cuda':
+        if isinstance(inv_jjt_cache, torch.Tensor):
+            inv_jjt_cache = inv_jjt_cache.pin_memory()
+        else:
+            inv_jjt_cache = [inv_jjt.pin_memory() for inv_jjt in inv_jjt_cache]
 
     return inv_jjt_cache
 
@@ -262,37 +729,148 @@ def batched_proj(
     return {k: v-vjp[k] for k, v in params_to_proj.items()}
 
 
+def batched_proj_samples(
+    func: Callable,
+    base_params: Dict,
+    params_to_proj: Dict,
+    xb: torch.Tensor,
+    yb: torch.Tensor,
+    inv_jjt: torch.Tensor,
+) -> Dict:
+    """
+    Projects a stack of S model parameters onto the null space of J at once (see `batched_proj`).
+
+    All samples share the same Jacobian, so the jvps of all samples are computed in a
+    single vectorized pass, and the vjp_fn of the batch is built once and reused for
+    every sample.
+
+    Parameters:
+    -----------
+
+    func : callable
+        single evaluation function -- typically, a loss function (in which O = 1)
+
+    base_params : dict
+        nominal model parameters
+
+    params_to_proj : dict
+        model parameters to-be-projected, each with a leading sample dimension S
+
+    xb : torch.tensor
+        batch of inputs -- typically of dimension (B, C, H, W)
+
+    yb : torch.tensor
+        batch of corresponding targets -- typically of dimension (B, C, H, W)
+
+    Returns:
+    --------
+    Dict
+        projections of params_to_proj onto the Jacobian null space,
+        each with a leading sample dimension S
+    """
+    def fp(p):
+        return tf.vmap(func, (None, 0, 0))(p, xb, yb)
+
+    def jvp_fn(v):
+        return tf.jvp(fp, (base_params,), (v,))[1]
+
+    # let V = new_params, one row per sample. First, JV:
+    jvp = tf.vmap(jvp_fn)(params_to_proj)
+    # next, U = inv_jjt @ JV, for each sample
+    inv_jjt_jv = torch.matmul(jvp, inv_jjt.mT)
+    # finally, J.T U, reusing the same vjp_fn for all samples
+    _, vjp_fn = tf.vjp(fp, base_params)
+    vjp = tf.vmap(vjp_fn)(inv_jjt_jv)[0]
+    return {k: v-vjp[k] for k, v in params_to_proj.items()}
+
+
+@functools.cache
+def compiled_variant(fn: Callable, fullgraph: bool = False) -> Callable:
+    """
+    Returns the torch.compile'd variant of one of the functions above.
+
+    The variant is only built when first requested, so that importing this module
+    does not require a torch.compile-capable environment. It is further compiled
+    on first call, and specialized once per distinct batch shape.
+
+    Parameters:
+    -----------
+
+    fn : callable
+        function to be compiled, e.g. `batched_jjt` or `batched_proj`
+
+    fullgraph : bool
+        if True, graph breaks raise an error instead of falling back to eager code
+
+    Returns:
+    --------
+    callable
+        compiled function
+    """
+    return torch.compile(fn, fullgraph=fullgraph)
+
+
 def apply_proj_cycle(
     func: Callable,
     base_params: Dict,
     params: Dict,
     dataloader: DataLoader,
-    inv_jjt_cache: List,
+    inv_jjt_cache: torch.Tensor | List,
+    compiled: bool = False,
+    stacked: bool = False,
+    stream: torch.cuda.Stream = None,
 ) -> Dict:
     """
     tbd
+
+    On the gpu, the inverses are copied to the device on the side `stream`,
+    which is created here if not given.
     """
-    proj_params = copy.deepcopy(params)
+    proj_params = dict(params)
     device = next(iter(base_params.items()))[1].device
+    if stacked:
+        # params holds a stack of samples along a leading dimension. This path is never
+        # compiled: inductor fails on its vmapped vjp_fn (torch 2.5)
+        proj_fn = batched_proj_samples
+    else:
+        proj_fn = compiled_variant(batched_proj, fullgraph=True) if compiled else batched_proj
 
-    def _batched_proj(p, xb, yb, inv_jjt):
-        return batched_proj(
-            func,
-            base_params,
-            p,
-            xb.to(device),
-            yb.to(device),
-            inv_jjt.to(device),
-        )
+    # on the gpu, the inverse for batch b+1 is copied on a side stream
+    # while batch b is being projected
+    if stream is None and device.type == 'cuda':
+        stream = torch.cuda.Stream(device)
+
+    def _prefetch(inv_jjt):
+        if stream is None:
+            return inv_jjt.to(device)
+        with torch.cuda.stream(stream):
+            return inv_jjt.to(device, non_blocking=True)
+
+    next_inv_jjt = _prefetch(inv_jjt_cache[0]) if len(inv_jjt_cache) > 0 else None
 
     # for b, data in enumerate(tqdm.tqdm(dataloader, desc='batches', leave=False)):
     for b, data in enumerate(dataloader):
+        if b >= len(inv_jjt_cache):
+            raise IndexError(
+                f'dataloader yields more batches than the {len(inv_jjt_cache)} '
+                'precomputed inverses'
+            )
         xb, yb = data
-        proj_params = _batched_proj(
+        inv_jjt = next_inv_jjt
+        if stream is not None:
+            current_stream = torch.cuda.current_stream(device)
+            current_stream.wait_stream(stream)
+            inv_jjt.record_stream(current_stream)
+        if b + 1 < len(inv_jjt_cache):
+            next_inv_jjt = _prefetch(inv_jjt_cache[b + 1])
+
+        proj_params = proj_fn(
+            func,
+            base_params,
             proj_params,
-            xb,
-            yb,
-            inv_jjt_cache[b],
+            xb.to(device, non_blocking=True),
+            yb.to(device, non_blocking=True),
+            inv_jjt,
         )
     return proj_params
 
@@ -339,18 +917,26 @@ def alternating_projection(
     n_cycle: int,
     param_to_proj: Dict,
     dataloader: DataLoader,
-    inv_jjt_cache: List,
+    inv_jjt_cache: torch.Tensor | List,
+    compiled: bool = False,
+    stacked: bool = False,
 ) -> Dict:
     """
     Alternating Projection onto Jacobian Null Space
     """
-    p = copy.deepcopy(param_to_proj)
+    p = dict(param_to_proj)
+    device = next(iter(base_params.items()))[1].device
+    # the side stream for copying the inverses is shared by all cycles
+    stream = torch.cuda.Stream(device) if device.type == 'cuda' else None
     # for _ in tqdm.tqdm(range(n_cycle), desc='cycles', leave=False):
     for _ in range(n_cycle):
-        p = apply_proj_cycle(func, base_params, p, dataloader, inv_jjt_cache)
+        p = apply_proj_cycle(
+            func, base_params, p, dataloader, inv_jjt_cache, compiled, stacked, stream,
+        )
     return p
 
 
+@torch.no_grad()
 def lpp_sampler(
     n_samples: int,
     n_cycle: int,
@@ -358,19 +944,42 @@ def lpp_sampler(
     base_params: Dict,
     iso_precision: torch.Tensor,
     dataloader: DataLoader,
+    inv_jjt_cache_dir: str = None,
+    matrix_free: bool = False,
+    compiled: bool = False,
+    samples_per_pass: int = 1,
+    num_workers: int = None,
     inv_jjt_cache_path: str = None,
 ) -> List:
     """
     Loss Projected Posterior Sampler
 
     tbd
+
+    If `samples_per_pass` > 1, that many samples are projected together, sharing the
+    vjp of the loss on each batch (see `batched_proj_samples`), at the cost of memory
+    for that many parameter vectors.
+
+    The dataloader is iterated n_samples / samples_per_pass * n_cycle times. If `num_workers`
+    is given, a dataloader built without worker processes is wrapped by `prefetching_loader`
+    with that many workers; the dataset must then be safe to load in worker processes.
     """
+    if inv_jjt_cache_path is not None:
+        raise TypeError('inv_jjt_cache_path was replaced by inv_jjt_cache_dir')
+    if num_workers is not None:
+        device = next(iter(base_params.items()))[1].device
+        dataloader = prefetching_loader(
+            dataloader, num_workers, pin_memory=device.type == 'cuda',
+        )
+
     # load cache if it exists, else precompute and save
     inv_jjt_cache = precompute_inv_jjt(
             loss_fn,
             base_params,
             dataloader,
-            inv_jjt_cache_path,
+            inv_jjt_cache_dir,
+            matrix_free,
+            compiled,
         )
 
     # generate samples from isotropic Gaussian posterior approx
@@ -378,34 +987,69 @@ def lpp_sampler(
 
     # perform alternating projections for n_cycles
     proj_samples = []
-    for _, p_samp in enumerate(tqdm.tqdm(param_samples, desc='samples')):
+    if samples_per_pass == 1:
+        for _, p_samp in enumerate(tqdm.tqdm(param_samples, desc='samples')):
+            p = alternating_projection(
+                loss_fn,
+                base_params,
+                n_cycle,
+                p_samp,
+                dataloader,
+                inv_jjt_cache,
+                compiled,
+            )
+            proj_samples.append({k: v + p[k] for k, v in base_params.items()})
+        return proj_samples
+
+    for i0 in tqdm.trange(0, n_samples, samples_per_pass, desc='samples'):
+        group = param_samples[i0:i0 + samples_per_pass]
         p = alternating_projection(
             loss_fn,
             base_params,
             n_cycle,
-            p_samp,
+            {k: torch.stack([p_samp[k] for p_samp in group]) for k in base_params},
             dataloader,
             inv_jjt_cache,
+            compiled,
+            stacked=True,
+        )
+        proj_samples.extend(
+            {k: v + p[k][i] for k, v in base_params.items()} for i in range(len(group))
         )
-        proj_samples.append({k: v + p[k] for k, v in base_params.items()})
     return proj_samples
 
 
+@torch.no_grad()
 def estimate_precision(
     func: Callable,
     base_params: Dict,
     dataloader: DataLoader,
     n_samples: int = 100,
     n_cycle: int = 10,
+    inv_jjt_cache_dir: str = None,
+    matrix_free: bool = False,
+    compiled: bool = False,
+    num_workers: int = None,
     inv_jjt_cache_path: str = None,
 ) -> float:
     """
     Estimates the marginal likelihood maximizing precision for the isotropic
     Gaussian posterior approximation. 
+
+    If `num_workers` is given, a dataloader built without worker processes is wrapped by
+    `prefetching_loader` with that many workers; the dataset must then be safe to load
+    in worker processes.
     """
+    if inv_jjt_cache_path is not None:
+        raise TypeError('inv_jjt_cache_path was replaced by inv_jjt_cache_dir')
+    if num_workers is not None:
+        device = next(iter(base_params.items()))[1].device
+        dataloader = prefetching_loader(
+            dataloader, num_workers, pin_memory=device.type == 'cuda',
+        )
 
     norm_param = torch.sqrt(
-        sum((v**2).sum() for _, v in base_params.items()),
+        sum(torch.vdot(v.flatten(), v.flatten()) for _, v in base_params.items()),
     )
     n_params = sum(v.numel() for _, v in base_params.items())
 
@@ -414,12 +1058,14 @@ def estimate_precision(
             func,
             base_params,
             dataloader,
-            inv_jjt_cache_path,
+            inv_jjt_cache_dir,
+            matrix_free,
+            compiled,
         )
     # Hutchinson trace approximation
     trace_approx = 0
     for _ in range(n_samples):
-        test_params = randn_params(base_params, 1.0, 1)
+        test_params = randn_params(base_params, 1.0, 1)[0]
         param_proj = alternating_projection(
             func,
             base_params,
@@ -427,8 +1073,11 @@ def estimate_precision(
             test_params,
             dataloader,
             inv_jjt_cache,
+            compiled,
+        )
+        trace_approx += sum(
+            torch.vdot(v.flatten(), param_proj[k].flatten()) for k, v in test_params.items()
         )
-        trace_approx += sum((v*param_proj[k]).sum() for k, v in test_params.items())
     trace_approx = trace_approx / n_samples
     precision = norm_param / (n_params - trace_approx)
     return precision
\ No newline at end of file
@@ -6,8 +6,10 @@ These datasets are constructed using the imported Cahn-Hilliard simulator,
 and are saved in the HDF5 format.
 """
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import glob
+import json
 import os
-import pickle
 
 import h5py
 import numpy as np
@@ -15,6 +17,76 @@ from tqdm import tqdm
 
 from simulator.simulator import CahnHilliardSimulator
 
+def run_experiments(
+    file_name: str,
+    run_ids: range,
+    u_init: np.ndarray,
+    n_steps: int,
+    dt: float,
+    dtype: str,
+) -> None:
+    """
+    Runs a batch of simulations and saves them to an HDF5 file.
+
+    Parameters:
+    -----------
+    file_name : str
+        Path of the HDF5 file to be created.
+    run_ids : range
+        Indices of the runs in the batch, used to name their HDF5 groups.
+    u_init : np.ndarray
+        Initial concentration fields, of shape (len(run_ids), x_res, y_res).
+    n_steps : int
+        Number of time steps per simulation.
+    dt : float
+        Integrator time step.
+    dtype : str
+        Storage precision of the field values.
+    """
+    simulator = CahnHilliardSimulator(dt=dt)
+    n_batch = len(run_ids)
+    n_times = n_steps + 1
+
+    with h5py.File(file_name, 'w') as h5f:
+        # Create a group in the HDF5 file for each run, with the field values
+        # preallocated and chunked per time step, so that each step is written
+        # in place as it is computed. The simulator runs in float64, and the
+        # fields are only downcast to the storage dtype when written.
+        run_groups = []
+        field_dsets = []
+        for ii in run_ids:
+            run_group = h5f.create_group(f'run_{ii}')
+            run_groups.append(run_group)
+            run_group.create_dataset('x_coordinates', data=simulator.X)
+            run_group.create_dataset('y_coordinates', data=simulator.Y)
+            field_dsets.append(
+                run_group.create_dataset(
+                    'field_values',
+                    shape=(n_times, simulator.x_res, simulator.y_res),
+                    dtype=dtype,
+                    chunks=(1, simulator.x_res, simulator.y_res),
+                    compression='lzf',
+                )
+            )
+            run_group.create_dataset('length', data=n_times)
+
+        # Initialize the simulator with the batch of initial concentration fields
+        simulator.initialize(u=u_init)
+
+        # Run the simulations for the specified number of steps, writing the
+        # concentration fields. All runs share the same times, which are
+        # collected and written once per run at the end.
+        times = np.empty(n_times)
+        for i in range(n_times):
+            u = u_init if i == 0 else simulator.step()
+            times[i] = simulator.t
+            for k in range(n_batch):
+                field_dsets[k][i] = u[k]
+
+        for run_group in run_groups:
+            run_group.create_dataset('time', data=times)
+
+
 def main(args: argparse.Namespace) -> None:
     # Create a directory for storing data if it does not exist
     data_dir = 'data'
@@ -23,7 +95,7 @@ def main(args: argparse.Namespace) -> None:
 
     # Set a random seed for reproducibility
     seed_val = 2023
-    np.random.seed(seed_val)
+    rng = np.random.default_rng(seed_val)
 
     # Define the number of experiments for each mode
     experiments = {
@@ -38,52 +110,64 @@ def main(args: argparse.Namespace) -> None:
         'test': args.n_steps_test,
     }
 
-    # Initialize and save the Cahn-Hilliard simulator
+    # Initialize the Cahn-Hilliard simulator. Its configuration is stored with
+    # each dataset, from which it can be rebuilt via CahnHilliardSimulator.from_config
     simulator = CahnHilliardSimulator(dt=args.dt)
-    with open(f'{data_dir}/simulator.pkl', 'wb') as f:
-        pickle.dump(simulator, f)
+    simulator_config = json.dumps(simulator.get_config())
 
     # Generate datasets for each mode (train, valid, test)
-    for mode, n_experiments in experiments.items():
-        # Define file name for the current mode's dataset
-        file_name = os.path.join(data_dir, f'{mode}_data.h5')
-
-        # Create an HDF5 file to store the simulation data
-        with h5py.File(file_name, 'w') as h5f:
-            for ii in tqdm(range(n_experiments), desc=f'{mode}'):
-                
-                # Work in progress -- initialization of concentration field.
-                # The choice of nominal concentration and noise strongly impacts
-                # the geometry of the phase field during its evolution. In an ML context,  
-                # this directly impacts the diversity of the training data.
-
-                u0_nominal = (2.0*np.random.rand()-1.0) * np.ones((simulator.x_res, simulator.y_res))
-                u0_noise = args.init_noise_scale * (2.0*np.random.rand(simulator.x_res, simulator.y_res)-1.0)
-                u_init = np.clip(u0_nominal + u0_noise, -1.0, 1.0)
-
-                # Initialize concentration field and time lists
-                u = [u_init]
-                t = [0.0]
-
-                # Initialize the simulator with the initial concentration field
-                simulator.initialize(u=u[0])
-
-                # Run the simulation for the specified number of steps
-                for _ in range(experiment_durations[mode]):
-                    u.append(simulator.step())  # Update concentration field
-                    t.append(simulator.t)       # Record the current time
-
-                # Stack the concentration fields into a 3D array
-                u = np.stack(u, axis=0)
-                t = np.array(t)  # Convert time list to numpy array
-
-                # Create a group in the HDF5 file for this run
-                run_group = h5f.create_group(f'run_{ii}')
-                run_group.create_dataset('x_coordinates', data=simulator.X)
-                run_group.create_dataset('y_coordinates', data=simulator.Y)
-                run_group.create_dataset('field_values', data=u)
-                run_group.create_dataset('time', data=t)
-                run_group.create_dataset('length', data=len(t))
+    with ProcessPoolExecutor(max_workers=args.n_workers) as executor:
+        for mode, n_experiments in experiments.items():
+            # Define file name for the current mode's dataset
+            file_name = os.path.join(data_dir, f'{mode}_data.h5')
+
+            # Remove the part files of a previous run, which may have been
+            # split into more batches than the current one
+            for stale_part in glob.glob(os.path.join(data_dir, f'{mode}_data_*.h5')):
+                os.remove(stale_part)
+
+            # Work in progress -- initialization of concentration field.
+            # The choice of nominal concentration and noise strongly impacts
+            # the geometry of the phase field during its evolution. In an ML context,  
+            # this directly impacts the diversity of the training data.
+
+            # All initial conditions of the current mode are drawn upfront, so the RNG
+            # stream is consumed in a fixed order, independent of the simulation batching
+            u0_nominal = 2.0*rng.random((n_experiments, 1, 1)) - 1.0
+            u_inits = 2.0*rng.random((n_experiments, simulator.x_res, simulator.y_res)) - 1.0
+            u_inits *= args.init_noise_scale
+            u_inits += u0_nominal
+            np.clip(u_inits, -1.0, 1.0, out=u_inits)
+
+            # Simulations are independent, so they are stepped in batches of
+            # (up to) sim_batch_size runs at once, with the batches distributed
+            # across worker processes. Each batch is written to its own HDF5 file.
+            batches = {}
+            futures = []
+            for i0 in range(0, n_experiments, args.sim_batch_size):
+                run_ids = range(i0, min(i0 + args.sim_batch_size, n_experiments))
+                part_name = f'{mode}_data_{len(batches)}.h5'
+                batches[part_name] = run_ids
+                futures.append(
+                    executor.submit(
+                        run_experiments,
+                        os.path.join(data_dir, part_name),
+                        run_ids,
+                        u_inits[run_ids.start:run_ids.stop],
+                        experiment_durations[mode],
+                        args.dt,
+                        args.dtype,
+                    )
+                )
+            for future in tqdm(as_completed(futures), total=len(futures), desc=f'{mode}'):
+                future.result()
+
+            # Create an HDF5 file presenting the runs of all batches as a single dataset
+            with h5py.File(file_name, 'w') as h5f:
+                h5f.attrs['simulator_config'] = simulator_config
+                for part_name, run_ids in batches.items():
+                    for ii in run_ids:
+                        h5f[f'run_{ii}'] = h5py.ExternalLink(part_name, f'run_{ii}')
 
 if __name__ == "__main__":
     # Argument parser
@@ -97,6 +181,9 @@ if __name__ == "__main__":
     parser.add_argument('--n_valid', type=int, default=10, help='Number of simulations for validation')
     parser.add_argument('--n_test', type=int, default=50, help='Number of simulations for testing')
     parser.add_argument('--init_noise_scale', type=float, default=0.1, help='noise scale for uniform random initial condition')
+    parser.add_argument('--sim_batch_size', type=int, default=10, help='Number of simulations stepped simultaneously')
+    parser.add_argument('--n_workers', type=int, default=os.cpu_count(), help='Number of worker processes running simulations')
+    parser.add_argument('--dtype', type=str, default='float32', choices=['float32', 'float16'], help='Storage precision of the field values')
 
     # Parse arguments and run main function
     args = parser.parse_args()
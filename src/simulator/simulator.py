@@ -15,13 +15,14 @@ def dct2(a: np.ndarray) -> np.ndarray:
     Compute the 2D Discrete Cosine Transform (DCT) of a given array.
 
     This function performs a two-dimensional DCT by applying the DCT
-    along the rows and then along the columns. The normalization is set
-    to 'ortho'.
+    along the rows and then along the columns (i.e., the last two axes).
+    The normalization is set to 'ortho'.
 
     Parameters:
     -----------
     a : np.ndarray
-        A 2D numpy array on which the DCT is to be computed.
+        A 2D numpy array, or a batch of 2D arrays stacked along the leading
+        axes, on which the DCT is to be computed.
 
     Returns:
     --------
@@ -32,7 +33,7 @@ def dct2(a: np.ndarray) -> np.ndarray:
     -----------
     - https://inst.eecs.berkeley.edu/~ee123/sp16/Sections/JPEG_DCT_Demo.html
     """
-    return scipy.fftpack.dct(scipy.fftpack.dct(a, axis=0, norm='ortho'), axis=1, norm='ortho')
+    return scipy.fftpack.dct(scipy.fftpack.dct(a, axis=-2, norm='ortho'), axis=-1, norm='ortho')
 
 
 def idct2(a: np.ndarray) -> np.ndarray:
@@ -40,13 +41,14 @@ def idct2(a: np.ndarray) -> np.ndarray:
     Compute the 2D Inverse Discrete Cosine Transform (IDCT) of a given array.
 
     This function performs a two-dimensional IDCT by applying the IDCT
-    along the rows and then along the columns. The normalization is set
-    to 'ortho'.
+    along the rows and then along the columns (i.e., the last two axes).
+    The normalization is set to 'ortho'.
 
     Parameters:
     -----------
     a : np.ndarray
-        A 2D numpy array containing DCT coefficients to be transformed back.
+        A 2D numpy array, or a batch of 2D arrays stacked along the leading
+        axes, containing DCT coefficients to be transformed back.
 
     Returns:
     --------
@@ -57,7 +59,7 @@ def idct2(a: np.ndarray) -> np.ndarray:
     -----------
     - https://inst.eecs.berkeley.edu/~ee123/sp16/Sections/JPEG_DCT_Demo.html
     """
-    return scipy.fftpack.idct(scipy.fftpack.idct(a, axis=0, norm='ortho'), axis=1, norm='ortho')
+    return scipy.fftpack.idct(scipy.fftpack.idct(a, axis=-2, norm='ortho'), axis=-1, norm='ortho')
 
 
 class CahnHilliardSimulator:
@@ -68,10 +70,14 @@ class CahnHilliardSimulator:
     provides the mathematical and numerical derivations of the Cahn-Hilliard 
     equation.
 
+    Independent simulations can be run simultaneously by initializing the
+    simulator with a batch of concentration fields of shape (K, x_res, y_res).
+
     Attributes:
     -----------
     u : np.ndarray
-        The current state of the system (concentration field or order parameter).
+        The current state of the system (concentration field or order parameter),
+        of shape (x_res, y_res) or (K, x_res, y_res).
     x_res : int
         The resolution of the grid in the x-direction.
     y_res : int
@@ -139,6 +145,34 @@ class CahnHilliardSimulator:
         self.Leig = -(np.tile((xp**2), (y_res, 1)).T + np.tile(yq**2, (x_res, 1))) * (np.pi**2)
         self.CHeig = np.ones((x_res, y_res)) - 2 * self.dt * self.Leig + self.dt * (epsilon**2) * (self.Leig**2)
 
+    def get_config(self) -> dict:
+        """
+        Configuration from which the simulator can be reconstructed.
+
+        Returns:
+        --------
+        dict
+            Keyword arguments of the constructor.
+        """
+        return {'dt': self.dt}
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'CahnHilliardSimulator':
+        """
+        Construct a simulator from a configuration returned by `get_config`.
+
+        Parameters:
+        -----------
+        config : dict
+            Keyword arguments of the constructor.
+
+        Returns:
+        --------
+        CahnHilliardSimulator
+            A new (uninitialized) simulator.
+        """
+        return cls(**config)
+
     def free_energy_deriv(self, u: np.ndarray) -> np.ndarray:
         """
         Derivative of the free energy functional.
@@ -162,13 +196,18 @@ class CahnHilliardSimulator:
         Parameters:
         -----------
         u : np.ndarray
-            Initial concentration field to be set.
+            Initial concentration field to be set, of shape (x_res, y_res),
+            or (K, x_res, y_res) for a batch of K independent simulations.
 
         Raises:
         -------
         ValueError: If the shape of the initial concentration field is not
                     consistent with the simulator's resolution.
         """
+        if u.shape[-2:] != (self.x_res, self.y_res):
+            raise ValueError(
+                f'Field u has shape {u.shape}, expected (..., {self.x_res}, {self.y_res})'
+            )
         self.u = u
         self.t = 0.0
 
@@ -182,7 +221,8 @@ class CahnHilliardSimulator:
         Returns:
         --------
         np.ndarray
-            The updated concentration field after one time step.
+            The updated concentration field after one time step
+            (batched, if the simulator was initialized with a batch).
 
         Raises:
         -------
@@ -0,0 +1,56 @@
+"""
+Checks of the numerical routines in pipeline.inference.sampler.
+"""
+import os
+import sys
+
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('tqdm')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pipeline.inference.sampler import psd_inv  # noqa: E402
+
+
+def _spd(eigvals: torch.Tensor, seed: int = 0) -> torch.Tensor:
+    # random orthogonal eigenvectors with the prescribed spectrum
+    gen = torch.Generator().manual_seed(seed)
+    n = eigvals.numel()
+    q, _ = torch.linalg.qr(torch.randn(n, n, generator=gen, dtype=torch.float64))
+    return q @ torch.diag(eigvals.to(q.dtype)) @ q.T
+
+
+def _assert_matches_pinv(mats: torch.Tensor, rtol: float):
+    expected = torch.linalg.pinv(mats, hermitian=True)
+    err = torch.linalg.matrix_norm(psd_inv(mats) - expected)
+    assert (err <= rtol * torch.linalg.matrix_norm(expected)).all()
+
+
+def test_psd_inv_well_conditioned():
+    mats = torch.stack([_spd(torch.linspace(1.0, 2.0, 8), seed) for seed in range(3)])
+    _assert_matches_pinv(mats, rtol=1e-4)
+
+
+def test_psd_inv_rank_deficient():
+    # JJt of a (B, P) Jacobian with B > P has rank P
+    gen = torch.Generator().manual_seed(0)
+    jac = torch.randn(4, 8, 3, generator=gen, dtype=torch.float64)
+    _assert_matches_pinv(jac @ jac.mT, rtol=1e-8)
+
+
+def test_psd_inv_ill_conditioned():
+    # smallest eigenvalue only a few orders of magnitude above the jitter
+    mats = torch.stack([
+        _spd(torch.logspace(0, -4, 8, dtype=torch.float64), seed) for seed in range(3)
+    ])
+    _assert_matches_pinv(mats, rtol=1e-6)
+
+
+def test_psd_inv_mixed_batch():
+    # well-conditioned and rank deficient matrices in the same batch
+    gen = torch.Generator().manual_seed(1)
+    jac = torch.randn(8, 3, generator=gen, dtype=torch.float64)
+    mats = torch.stack([_spd(torch.linspace(1.0, 2.0, 8)), jac @ jac.T])
+    _assert_matches_pinv(mats, rtol=1e-4)